@@ -1,10 +1,13 @@
 # FastAPI + Silero VAD + Whisper 音声認識サーバ
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.responses import PlainTextResponse
+from fastapi.responses import ORJSONResponse
 
+import anyio
 import logging
 from logging.handlers import TimedRotatingFileHandler
 import os
@@ -66,8 +69,23 @@ logger = logging.getLogger(__name__)
 # セッション管理オブジェクトを作成 (プロダクション環境では DB 使用を推奨)
 active_sessions = {}
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 最初のリクエストを待たずに、起動時に VAD と Whisper のモデルをロードしておく
+    from speech_recognition import SpeechRecognizer
+    SpeechRecognizer.preload_vad()
+    SpeechRecognizer.preload_whisper(WHISPER_MODEL)
+
+    # 前回の実行中に WAV 変換が中断されて残った一時ファイルを削除
+    HttpSpeechRecognitionAdminService.cleanup_wav_cache()
+
+    # 同期関数のエンドポイント（管理 API）を実行するスレッドプールの上限を拡張（デフォルト: 40）
+    # WAV 配信などの重い処理が混雑しても、スレッド待ちで他のリクエストが滞留しにくくする
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 64
+    yield
+
 # FastAPI オブジェクトを作成
-app = FastAPI(title="Audio Recognition Server", version="1.0.0")
+app = FastAPI(title="Audio Recognition Server", version="1.0.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 
 logger.info(f"Whisper model is '{WHISPER_MODEL}'")
@@ -150,9 +168,9 @@ def update_audio_log_config(config: dict):
 
 
 @app.get("/logs/audio/list")
-def list_audio_logs():
+def list_audio_logs(limit: int = 200, offset: int = 0):
     """音声ログファイル一覧を取得"""
-    return HttpSpeechRecognitionAdminService.list_audio_logs()
+    return HttpSpeechRecognitionAdminService.list_audio_logs(limit, offset)
 
 
 @app.get("/logs/audio/play/{filename}")
@@ -162,9 +180,9 @@ def play_audio_file(filename: str):
 
 
 @app.get("/logs/audio/info/{filename}")
-def get_audio_file_info(filename: str):
+def get_audio_file_info(filename: str, stats: bool = False):
     """音声ログファイルの詳細情報を取得（デバッグ用）"""
-    return HttpSpeechRecognitionAdminService.get_audio_file_info(filename)
+    return HttpSpeechRecognitionAdminService.get_audio_file_info(filename, include_stats=stats)
 
 
 @app.get("/logs/audio/download/{filename}")
@@ -184,11 +202,18 @@ if __name__ == "__main__":
     except:
         pass
 
+    import sys
+
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        # uvloop は Windows 非対応
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools",
+        ws="websockets",
+        # ファイル監視のリローダーは CPU を消費するため使用しない（開発時のみ True にする）
+        reload=False,
         log_config=None,
         log_level=None#AppConfig.log_level
     )
@@ -82,7 +82,7 @@ export default class SpeechRecognizer {
 
             // Connection succeeded.
             this.logger.info("WebSocket connection established");
-            this.#websocket.send(JSON.stringify({lang:this.lang, prompt:this.prompt}));
+            this.#websocket.send(JSON.stringify({lang:this.lang, prompt:this.prompt, sample_format:"i16"}));
             this.#resourceStateChanged();
 
         } catch (error) {
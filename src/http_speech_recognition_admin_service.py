@@ -1,21 +1,65 @@
 
 import numpy as np
-import json
+import orjson
 import logging
-import io
+import math
+import os
+import struct
+import tempfile
 from datetime import datetime
 from pathlib import Path
 
 from fastapi import HTTPException
 from fastapi.responses import FileResponse, StreamingResponse
 from speech_recognition import SpeechRecognizer
+from speech_recognition.audio_logger import AudioLogger, RAW_HEADER_STRUCT, WAV_CACHE_DIR
+from .http_speech_recognition_service import HttpSpeechRecognitionService
 
 logger = logging.getLogger(__name__)
 
+# WAV ヘッダー (44 bytes, little-endian)
+#   RIFF チャンク: ChunkID, ChunkSize, Format
+#   fmt チャンク : Subchunk1ID, Subchunk1Size, AudioFormat, NumChannels,
+#                  SampleRate, ByteRate, BlockAlign, BitsPerSample
+#   data チャンク: Subchunk2ID, Subchunk2Size
+_WAV_HEADER_STRUCT = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+# WAV 配信時に一度に読み込む RAW データのバイト数 (Float32 の倍数)
+_WAV_STREAM_CHUNK_BYTES = 64 * 1024
+
+def _read_raw_metadata(raw_file_path, meta_file_path=None):
+    """RAW ファイルのメタデータを読み込む
+
+    ヘッダー付きのファイルはヘッダーから、ヘッダーの無い旧形式のファイルは
+    meta_file_path で指定したメタデータファイル（.meta）が存在すればそこから読み込む。
+
+    Returns:
+        (メタデータの辞書（読み込めなければ空の辞書）, 音声データの開始位置（ヘッダーのバイト数）)
+    """
+    try:
+        metadata = AudioLogger.read_header(raw_file_path)
+        if metadata is not None:
+            header_size = metadata.pop("header_size")
+            return metadata, header_size
+
+        if meta_file_path is not None:
+            try:
+                with open(meta_file_path, 'rb') as f:
+                    return orjson.loads(f.read()), 0
+            except FileNotFoundError:
+                pass
+    except Exception as e:
+        logger.warning(f"Failed to read metadata for {raw_file_path}: {e}")
+    return {}, 0
+
 class HttpSpeechRecognitionAdminService:
 
     active_sessions = None
 
+    # list_audio_logs のファイル一覧キャッシュ（出力ディレクトリと更新日時が同じ間は再利用）
+    _list_cache = None  # (作成日時の新しい順のファイル一覧, 合計サイズ)
+    _list_cache_key = None
+
     @staticmethod
     def get_vad_config():
         """VAD 設定を取得"""
@@ -23,11 +67,13 @@ class HttpSpeechRecognitionAdminService:
             "config": SpeechRecognizer.vad_config.to_dict(),
             "descriptions": {
                 "threshold": "Speech detection confidence threshold (0.0–1.0)",
+                "threshold_logit": "Threshold converted to logit space (read-only)",
                 "min_speech_duration_ms": "Ignore speech shorter than this (ms)",
                 "max_speech_duration_s": "Cut speech longer than this (sec)",
                 "prefix_speech_pad_ms": "Helps prevents cutting off beginning of speech (ms)",
                 "silence_duration_ms": "Speech considered finished after this silence",
-                "chunk_size": "Number of samples per process (32ms@16kHz=512)"
+                "chunk_size": "Number of samples per process (32ms@16kHz=512)",
+                "energy_gate_ratio": "Skip VAD for chunks quieter than noise floor × this (0 = disabled)"
             }
         }
 
@@ -57,6 +103,9 @@ class HttpSpeechRecognitionAdminService:
                 "status": "error",
                 "message": str(e)
             }
+        finally:
+            # 途中で失敗した場合も設定の一部が変更されている可能性があるため、常にキャッシュを破棄する
+            HttpSpeechRecognitionService.invalidate_health_cache()
 
     @classmethod
     def reset_vad_config(cls):
@@ -83,6 +132,9 @@ class HttpSpeechRecognitionAdminService:
                 "status": "error",
                 "message": str(e)
             }
+        finally:
+            # 途中で失敗した場合も設定が変更されている可能性があるため、常にキャッシュを破棄する
+            HttpSpeechRecognitionService.invalidate_health_cache()
 
     @staticmethod
     def get_audio_log_config():
@@ -95,8 +147,8 @@ class HttpSpeechRecognitionAdminService:
         }
 
 
-    @staticmethod
-    def update_audio_log_config(config: dict):
+    @classmethod
+    def update_audio_log_config(cls, config: dict):
         """音声ログ設定を更新"""
         audio_log_config = SpeechRecognizer.audio_log_config
 
@@ -132,11 +184,15 @@ class HttpSpeechRecognitionAdminService:
                 "status": "error",
                 "message": str(e)
             }
+        finally:
+            # 途中で失敗した場合も設定の一部が変更されている可能性があるため、常にキャッシュを破棄する
+            cls._list_cache_key = None
+            HttpSpeechRecognitionService.invalidate_health_cache()
 
 
-    @staticmethod
-    def list_audio_logs():
-        """音声ログファイル一覧を取得"""
+    @classmethod
+    def list_audio_logs(cls, limit: int = 200, offset: int = 0):
+        """音声ログファイル一覧を取得（作成日時の新しい順に offset 番目から最大 limit 件）"""
         audio_log_config = SpeechRecognizer.audio_log_config
 
         try:
@@ -145,48 +201,29 @@ class HttpSpeechRecognitionAdminService:
 
             output_path = Path(audio_log_config.output_dir)
             if not output_path.exists():
-                return {"files": [], "total": 0}
+                return {"files": [], "total": 0, "returned": 0, "offset": offset}
 
-            # RAW ファイルのみ取得
-            raw_files = list(output_path.glob("*.raw"))
+            # ディレクトリに変更が無ければ前回作成した一覧を使い、ページごとに切り出す
+            key = (audio_log_config.output_dir, output_path.stat().st_mtime_ns)
+            if key != cls._list_cache_key:
+                cls._list_cache = cls._scan_audio_logs(output_path, cls._list_cache)
+                cls._list_cache_key = key
+            entries = cls._list_cache[0]
 
+            offset = max(0, offset)
+            limit = max(0, limit)
             file_info = []
-            for file_path in sorted(raw_files, key=lambda x: x.stat().st_ctime, reverse=True):
-                try:
-                    stat = file_path.stat()
-                    meta_file = file_path.with_suffix('.meta')
-
-                    info = {
-                        "filename": file_path.name,
-                        "size_bytes": stat.st_size,
-                        "created_at": datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                        "modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                        "has_metadata": meta_file.exists()
-                    }
-
-                    # メタデータがあれば読み込み
-                    if meta_file.exists():
-                        try:
-                            with open(meta_file, 'r', encoding='utf-8') as f:
-                                metadata = json.load(f)
-                                info.update({
-                                    "session_id": metadata.get("session_id"),
-                                    "duration_seconds": metadata.get("duration_seconds"),
-                                    "samples": metadata.get("samples"),
-                                    "sample_rate": metadata.get("sample_rate")
-                                })
-                        except Exception as e:
-                            logger.warning(f"Failed to read metadata for {file_path}: {e}")
-
+            for entry in entries[offset:offset + limit]:
+                info = cls._get_audio_log_info(entry)
+                if info is not None:
                     file_info.append(info)
 
-                except Exception as e:
-                    logger.error(f"Failed to get info for {file_path}: {e}")
-
             return {
                 "files": file_info,
-                "total": len(file_info),
-                "total_size_bytes": sum(f["size_bytes"] for f in file_info)
+                "total": len(entries),
+                "returned": len(file_info),
+                "offset": offset,
+                "total_size_bytes": cls._list_cache[1]
             }
 
         except Exception as e:
@@ -194,6 +231,104 @@ class HttpSpeechRecognitionAdminService:
             return {"error": str(e)}
 
 
+    @staticmethod
+    def _scan_audio_logs(output_path, previous=None):
+        """出力ディレクトリを走査し、RAW ファイルの一覧を作成日時の新しい順に作成
+
+        前回の一覧（previous）にサイズと更新日時が同じファイルがあれば、読み込み済みの情報を引き継ぐ
+
+        Returns:
+            (ファイルごとの辞書のリスト, 合計サイズ)
+        """
+        # ディレクトリを一度だけ走査し、RAW ファイルと旧形式のメタデータファイルを集める
+        # (DirEntry.stat() の結果はキャッシュされる)
+        raws = []
+        metas = set()
+        with os.scandir(output_path) as it:
+            for entry in it:
+                name = entry.name
+                if name.endswith('.raw'):
+                    raws.append(entry)
+                elif name.endswith('.meta'):
+                    metas.add(name)
+
+        known = {entry["path"]: entry for entry in previous[0]} if previous else {}
+        entries = []
+        total_size = 0
+        for dir_entry in raws:
+            try:
+                stat = dir_entry.stat()
+            except FileNotFoundError:
+                continue
+            name = dir_entry.name
+            old = known.get(dir_entry.path)
+            if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                entries.append(old)
+            else:
+                # メタデータファイルの有無は走査結果で判定する（追加の stat は行わない）
+                meta_name = name[:-4] + '.meta'
+                entries.append({
+                    "name": name,
+                    "path": dir_entry.path,
+                    "meta_path": os.path.join(output_path, meta_name) if meta_name in metas else None,
+                    "ctime": stat.st_ctime,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "info": None
+                })
+            total_size += stat.st_size
+
+        entries.sort(key=lambda entry: entry["ctime"], reverse=True)
+        return entries, total_size
+
+
+    @classmethod
+    def _get_audio_log_info(cls, entry):
+        """一覧の 1 ファイル分の情報を作成（作成済みであれば再利用）"""
+        if entry["info"] is not None:
+            return entry["info"]
+
+        try:
+            if entry["size"] < RAW_HEADER_STRUCT.size:
+                # 作成直後で書き込み途中の可能性があるため、サイズを取り直す
+                stat = os.stat(entry["path"])
+                entries, total_size = cls._list_cache
+                cls._list_cache = (entries, total_size + stat.st_size - entry["size"])
+                entry["size"] = stat.st_size
+                entry["mtime_ns"] = stat.st_mtime_ns
+
+            metadata, _ = _read_raw_metadata(entry["path"], entry["meta_path"])
+            has_metadata = bool(metadata)
+
+            info = {
+                "filename": entry["name"],
+                "size_bytes": entry["size"],
+                "created_at": datetime.fromtimestamp(entry["ctime"]),
+                "modified_at": datetime.fromtimestamp(entry["mtime_ns"] / 1e9),
+                "has_metadata": has_metadata
+            }
+
+            # メタデータがあれば追加
+            if has_metadata:
+                info.update({
+                    "session_id": metadata.get("session_id"),
+                    "duration_seconds": metadata.get("duration_seconds"),
+                    "samples": metadata.get("samples"),
+                    "sample_rate": metadata.get("sample_rate")
+                })
+
+            # ヘッダーまで書き込まれたファイルのみ情報を保持する（それ以外は次回に作り直す）
+            if entry["size"] >= RAW_HEADER_STRUCT.size:
+                entry["info"] = info
+            return info
+
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Failed to get info for {entry['path']}: {e}")
+            return None
+
+
     @staticmethod
     def play_audio_file(filename: str):
         """音声ログファイルを WAV 形式で配信"""
@@ -208,89 +343,93 @@ class HttpSpeechRecognitionAdminService:
                 raise HTTPException(status_code=400, detail="Invalid filename")
 
             raw_file_path = Path(audio_log_config.output_dir) / filename
-            meta_file_path = raw_file_path.with_suffix('.meta')
+            # WAV ファイルはサブディレクトリにキャッシュする（出力ディレクトリの更新日時を変えないため）
+            wav_cache_dir = raw_file_path.parent / WAV_CACHE_DIR
+            wav_file_path = wav_cache_dir / (raw_file_path.stem + '.wav')
 
             if not raw_file_path.exists():
                 raise HTTPException(status_code=404, detail="Audio file not found")
 
+            headers = {
+                "Content-Disposition": f"inline; filename=\"{filename.replace('.raw', '.wav')}\"",
+                "Cache-Control": "no-cache",
+                "Accept-Ranges": "bytes",
+                "Access-Control-Allow-Origin": "*"  # CORS対応
+            }
+
+            # 変換済みの WAV ファイルがあれば、そのまま配信（sendfile によるゼロコピー転送）
+            if wav_file_path.exists():
+                return FileResponse(wav_file_path, media_type="audio/wav", headers=headers)
+
             # メタデータを読み込み
-            sample_rate = 16000  # デフォルト値
-            if meta_file_path.exists():
-                try:
-                    with open(meta_file_path, 'r', encoding='utf-8') as f:
-                        metadata = json.load(f)
-                        sample_rate = metadata.get('sample_rate', 16000)
-                except Exception as e:
-                    logger.warning(f"Failed to read metadata: {e}")
+            metadata, header_size = _read_raw_metadata(raw_file_path, str(raw_file_path)[:-4] + '.meta')
+            sample_rate = metadata.get('sample_rate', 16000)
 
-            # RAW ファイルを読み込み
-            audio_data = np.fromfile(raw_file_path, dtype=np.float32)
-            logger.info(f"Loaded audio data: {len(audio_data)} samples, sample_rate: {sample_rate}")
+            # RAW ファイルは読み込まず、ファイルサイズから PCM データ長を求める
+            # (Float32 = 4 bytes -> 16bit PCM = 2 bytes)
+            samples = (raw_file_path.stat().st_size - header_size) // 4
+            pcm_length = samples * 2
+            logger.info(f"Audio file: {samples} samples, sample_rate: {sample_rate}")
 
-            if len(audio_data) == 0:
+            if samples == 0:
                 raise HTTPException(status_code=400, detail="Empty audio file")
 
-            # 音声データの範囲をチェック
-            logger.info(f"Audio data range: min={np.min(audio_data):.4f}, max={np.max(audio_data):.4f}")
+            # WAV ヘッダーを構築（より確実な Safari 対応）
+            header = _WAV_HEADER_STRUCT.pack(
+                b'RIFF', 36 + pcm_length, b'WAVE',
+                b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+                b'data', pcm_length
+            )
 
-            try:
-                # Float32 を 16bit PCM に変換
-                # -1.0～1.0 の範囲を-32768～32767 にマップ
-                audio_clipped = np.clip(audio_data, -1.0, 1.0)
-                audio_int16 = (audio_clipped * 32767).astype(np.int16)
-
-                logger.info(f"Converted to 16bit PCM: {len(audio_int16)} samples")
-                logger.info(f"PCM range: min={np.min(audio_int16)}, max={np.max(audio_int16)}")
-
-                # WAV ファイルを手動で構築（より確実な Safari 対応）
-                pcm_data = audio_int16.tobytes()
-                pcm_length = len(pcm_data)
-
-                # WAV ヘッダーを手動構築
-                header = bytearray()
-
-                # RIFF ヘッダー
-                header.extend(b'RIFF')  # ChunkID
-                header.extend((36 + pcm_length).to_bytes(4, 'little'))  # ChunkSize
-                header.extend(b'WAVE')  # Format
-
-                # fmt チャンク
-                header.extend(b'fmt ')  # Subchunk1ID
-                header.extend((16).to_bytes(4, 'little'))  # Subchunk1Size (PCM = 16)
-                header.extend((1).to_bytes(2, 'little'))   # AudioFormat (PCM = 1)
-                header.extend((1).to_bytes(2, 'little'))   # NumChannels (mono = 1)
-                header.extend(sample_rate.to_bytes(4, 'little'))  # SampleRate
-                header.extend((sample_rate * 2).to_bytes(4, 'little'))  # ByteRate (SampleRate * NumChannels * BitsPerSample/8)
-                header.extend((2).to_bytes(2, 'little'))   # BlockAlign (NumChannels * BitsPerSample/8)
-                header.extend((16).to_bytes(2, 'little'))  # BitsPerSample
-
-                # data チャンク
-                header.extend(b'data')  # Subchunk2ID
-                header.extend(pcm_length.to_bytes(4, 'little'))  # Subchunk2Size
-
-                # 完全な WAV ファイル
-                wav_content = bytes(header) + pcm_data
-
-                logger.info(f"WAV file created successfully: {len(wav_content)} bytes")
-                logger.info(f"WAV header verification: {wav_content[:4]} (should be b'RIFF')")
-                logger.info(f"WAV format verification: {wav_content[8:12]} (should be b'WAVE')")
-
-                # WAV ファイルとして返す
-                return StreamingResponse(
-                    io.BytesIO(wav_content),
-                    media_type="audio/wav",
-                    headers={
-                        "Content-Disposition": f"inline; filename=\"{filename.replace('.raw', '.wav')}\"",
-                        "Content-Length": str(len(wav_content)),
-                        "Cache-Control": "no-cache",
-                        "Accept-Ranges": "bytes",
-                        "Access-Control-Allow-Origin": "*"  # CORS対応
-                    }
-                )
-
-            except Exception as wav_error:
-                logger.error(f"WAV conversion error: {wav_error}")
-                raise HTTPException(status_code=500, detail=f"WAV conversion failed: {wav_error}")
+            def generate_wav():
+                # 配信と同時に一時ファイルへ書き出し、最後まで変換できたら WAV ファイルとして保存する
+                # (プロセスが異常終了して残った一時ファイルは、起動時に cleanup_wav_cache で削除する)
+                wav_cache_dir.mkdir(exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=wav_cache_dir, suffix='.tmp')
+                completed = False
+                # RAW ファイルをメモリマップし、ページキャッシュから直接読み出す
+                # 変換用バッファは使い回し、変換はすべてインプレースで行う
+                chunk_samples = _WAV_STREAM_CHUNK_BYTES // 4
+                buf = np.empty(chunk_samples, dtype=np.float32)
+                buf_int16 = np.empty(chunk_samples, dtype=np.int16)
+                try:
+                    with os.fdopen(fd, 'wb') as wav_file:
+                        wav_file.write(header)
+                        yield header
+                        audio_data = np.memmap(raw_file_path, dtype=np.float32, mode='r', offset=header_size, shape=(samples,))
+                        try:
+                            for start in range(0, samples, chunk_samples):
+                                n = min(chunk_samples, samples - start)
+                                # Float32 を 16bit PCM に変換
+                                # -1.0～1.0 の範囲を-32768～32767 にマップ
+                                chunk = buf[:n]
+                                np.clip(audio_data[start:start + n], -1.0, 1.0, out=chunk)
+                                np.multiply(chunk, 32767.0, out=chunk)
+                                np.copyto(buf_int16[:n], chunk, casting='unsafe')
+                                pcm_data = buf_int16[:n].tobytes()
+                                wav_file.write(pcm_data)
+                                yield pcm_data
+                        finally:
+                            # ストリーム終了時（中断時を含む）にファイルのマッピングを解放
+                            del audio_data
+                    os.replace(tmp_path, wav_file_path)
+                    completed = True
+                except Exception as e:
+                    logger.error(f"WAV conversion error: {e}")
+                    raise
+                finally:
+                    if not completed:
+                        try:
+                            os.unlink(tmp_path)
+                        except OSError:
+                            pass
+
+            # WAV ファイルとしてチャンク単位で返す
+            return StreamingResponse(
+                generate_wav(),
+                media_type="audio/wav",
+                headers={**headers, "Content-Length": str(len(header) + pcm_length)}
+            )
 
         except HTTPException:
             raise
@@ -300,8 +439,33 @@ class HttpSpeechRecognitionAdminService:
 
 
     @staticmethod
-    def get_audio_file_info(filename: str):
-        """音声ログファイルの詳細情報を取得（デバッグ用）"""
+    def cleanup_wav_cache():
+        """WAV 変換や音声ログの書き込みの途中で残った一時ファイルを削除（起動時に呼び出す）"""
+        output_dir = SpeechRecognizer.audio_log_config.output_dir
+        # 出力ディレクトリには音声ログ書き込み時の一時ファイルが作成される
+        # (以前のバージョンでは WAV 変換の一時ファイルも出力ディレクトリに作成していた)
+        for dir_path in (os.path.join(output_dir, WAV_CACHE_DIR), output_dir):
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.name.endswith('.tmp') and entry.is_file():
+                            try:
+                                os.unlink(entry.path)
+                                logger.info(f"Deleted stale WAV temporary file: {entry.path}")
+                            except OSError as e:
+                                logger.warning(f"Failed to delete {entry.path}: {e}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"WAV cache cleanup error: {e}")
+
+
+    @staticmethod
+    def get_audio_file_info(filename: str, include_stats: bool = False):
+        """音声ログファイルの詳細情報を取得（デバッグ用）
+
+        include_stats が True の場合のみ RAW ファイルを読み込み、音声データの統計を計算する
+        """
 
         audio_log_config = SpeechRecognizer.audio_log_config
 
@@ -314,44 +478,45 @@ class HttpSpeechRecognitionAdminService:
                 raise HTTPException(status_code=400, detail="Invalid filename")
 
             raw_file_path = Path(audio_log_config.output_dir) / filename
-            meta_file_path = raw_file_path.with_suffix('.meta')
 
             if not raw_file_path.exists():
                 raise HTTPException(status_code=404, detail="Audio file not found")
 
-            # RAW ファイルを読み込み
-            audio_data = np.fromfile(raw_file_path, dtype=np.float32)
-
             # メタデータを読み込み
-            metadata = {}
-            if meta_file_path.exists():
-                try:
-                    with open(meta_file_path, 'r', encoding='utf-8') as f:
-                        metadata = json.load(f)
-                except Exception as e:
-                    logger.warning(f"Failed to read metadata: {e}")
+            metadata, header_size = _read_raw_metadata(raw_file_path, str(raw_file_path)[:-4] + '.meta')
 
             # ファイル統計情報
             file_stats = raw_file_path.stat()
+            data_size = file_stats.st_size - header_size
+            samples = data_size // 4  # Float32 = 4 bytes per sample
 
             # 音声データ統計
             audio_stats = {
-                "samples": len(audio_data),
-                "duration_seconds": len(audio_data) / metadata.get('sample_rate', 16000),
-                "min_value": float(np.min(audio_data)) if len(audio_data) > 0 else 0,
-                "max_value": float(np.max(audio_data)) if len(audio_data) > 0 else 0,
-                "mean_value": float(np.mean(audio_data)) if len(audio_data) > 0 else 0,
-                "rms_value": float(np.sqrt(np.mean(audio_data**2))) if len(audio_data) > 0 else 0
+                "samples": samples,
+                "duration_seconds": samples / metadata.get('sample_rate', 16000)
             }
+            if include_stats:
+                # RAW ファイルを読み込み
+                audio_data = np.fromfile(raw_file_path, dtype=np.float32, offset=header_size)
+                n = audio_data.size
+                # RMS は二乗した配列を作らず、内積（BLAS）で二乗和を求める
+                ssq = float(np.dot(audio_data, audio_data)) if n else 0.0
+                audio_stats.update({
+                    "samples": n,
+                    "min_value": float(np.min(audio_data)) if n else 0,
+                    "max_value": float(np.max(audio_data)) if n else 0,
+                    "mean_value": float(np.mean(audio_data)) if n else 0,
+                    "rms_value": math.sqrt(ssq / n) if n else 0.0
+                })
 
             return {
                 "filename": filename,
                 "file_size_bytes": file_stats.st_size,
-                "expected_samples": file_stats.st_size // 4,  # Float32 = 4 bytes per sample
+                "expected_samples": samples,
                 "metadata": metadata,
                 "audio_stats": audio_stats,
-                "created_at": datetime.fromtimestamp(file_stats.st_ctime).isoformat(),
-                "is_valid": len(audio_data) > 0 and file_stats.st_size % 4 == 0
+                "created_at": datetime.fromtimestamp(file_stats.st_ctime),
+                "is_valid": audio_stats["samples"] > 0 and data_size % 4 == 0
             }
 
         except HTTPException:
@@ -1,6 +1,6 @@
 import asyncio
-import json
 import logging
+import orjson
 from fastapi import WebSocket, WebSocketDisconnect
 from speech_recognition import SpeechRecognizer
 
@@ -12,6 +12,9 @@ class HttpSpeechRecognitionService:
     continuous_recognition = False
     receiveTimeoutSec = None
 
+    # health_check の応答のうち、設定から決まる部分のキャッシュ
+    _health_cache_static = None
+
     @staticmethod
     async def _on_speech_start(websocket, session_id, speech_id, param):
         response = {
@@ -23,7 +26,7 @@ class HttpSpeechRecognitionService:
             "buffer_size": param,
             "timestamp": asyncio.get_running_loop().time()
         }
-        await websocket.send_text(json.dumps(response, ensure_ascii=False))
+        await websocket.send_text(orjson.dumps(response).decode())
 
 
     @staticmethod
@@ -37,7 +40,7 @@ class HttpSpeechRecognitionService:
             "buffer_size": param,
             "timestamp": asyncio.get_running_loop().time()
         }
-        await websocket.send_text(json.dumps(response, ensure_ascii=False))
+        await websocket.send_text(orjson.dumps(response).decode())
 
 
     @staticmethod
@@ -49,7 +52,7 @@ class HttpSpeechRecognitionService:
             "result": param,
             "timestamp": asyncio.get_running_loop().time()
         }
-        await websocket.send_text(json.dumps(response, ensure_ascii=False))
+        await websocket.send_text(orjson.dumps(response).decode())
         logger.info(f"Recognition result sent to session {session_id}: {response['result'].get('text', 'Error')}")
 
 
@@ -71,6 +74,7 @@ class HttpSpeechRecognitionService:
         # 音声認識のコールバック関数を定義
         async def callback(state, session_id, speech_id, param):
             """認識結果を WebSocket で送信"""
+            nonlocal close_requested
             try:
                 if (websocket.client_state.name == 'CONNECTED'):
                     # 発話開始
@@ -99,35 +103,44 @@ class HttpSpeechRecognitionService:
     
         try:
             try:
-                json = await asyncio.wait_for(websocket.receive_json(), timeout=cls.receiveTimeoutSec)
-                langCode = json["lang"]
-                prompt = json["prompt"]
+                init_msg = await asyncio.wait_for(websocket.receive_json(), timeout=cls.receiveTimeoutSec)
+                langCode = init_msg["lang"]
+                prompt = init_msg["prompt"]
+                sampleFormat = init_msg.get("sample_format")  # 省略時はデータから判定
             except asyncio.TimeoutError:
                 raise Exception("Timeout occurred: websocket.receive_text()")
             
             logger.info(f"Received lang code is '{langCode}'")
             logger.info(f"Received prompt is '{prompt}'")
+            logger.info(f"Received sample format is '{sampleFormat}'")
 
             speech_recognizer.language = langCode
             speech_recognizer.prompt = prompt
-
-            while True:
-                # バイナリデータを受信（音声データ）
-                try:
-                    audio_data = await asyncio.wait_for(websocket.receive_bytes(), timeout=cls.receiveTimeoutSec)
-                except asyncio.TimeoutError:
-                    raise Exception("Timeout occurred: websocket.receive_bytes()")
-
-                speech_recognizer.add_audio_chunk(audio_data)
-
-                #speech_detected, speech_ended = speech_recognizer.add_audio_chunk(audio_data)
-                # if auto_close and speech_ended:
-                #     await recognition_end_event.wait() # 音声認識が終了するまで待機
-                #     await websocket.close()
-                #     # websocket.close() only sends frames, and state transitions only occur
-                #     # when websocket.receive() is executed. Therefore, unless websocket.receive() is called,
-                #     # client_state remains CONNECTED. ==> managed with flag variable.
-                #     closed = True
+            speech_recognizer.set_sample_format(sampleFormat)
+
+            if cls.receiveTimeoutSec is None:
+                # タイムアウト無しの場合は wait_for を介さずにバイナリデータ（音声データ）を受信
+                async for audio_data in websocket.iter_bytes():
+                    speech_recognizer.add_audio_chunk(audio_data)
+                logger.info(f"WebSocket connection closed for session {session_id}")
+            else:
+                while True:
+                    # バイナリデータを受信（音声データ）
+                    try:
+                        audio_data = await asyncio.wait_for(websocket.receive_bytes(), timeout=cls.receiveTimeoutSec)
+                    except asyncio.TimeoutError:
+                        raise Exception("Timeout occurred: websocket.receive_bytes()")
+
+                    speech_recognizer.add_audio_chunk(audio_data)
+
+                    #speech_detected, speech_ended = speech_recognizer.add_audio_chunk(audio_data)
+                    # if auto_close and speech_ended:
+                    #     await recognition_end_event.wait() # 音声認識が終了するまで待機
+                    #     await websocket.close()
+                    #     # websocket.close() only sends frames, and state transitions only occur
+                    #     # when websocket.receive() is executed. Therefore, unless websocket.receive() is called,
+                    #     # client_state remains CONNECTED. ==> managed with flag variable.
+                    #     closed = True
 
         except WebSocketDisconnect:
             logger.info(f"WebSocket connection closed for session {session_id}")
@@ -142,16 +155,23 @@ class HttpSpeechRecognitionService:
                 await websocket.close()
 
 
+    @classmethod
+    def invalidate_health_cache(cls):
+        """設定変更時に health_check のキャッシュを破棄"""
+        cls._health_cache_static = None
+
     @classmethod
     def health_check(cls):
-        return {
-            "status": "healthy",
-            "active_sessions": len(cls.active_sessions),
-            "vad_model_loaded": SpeechRecognizer.is_vad_model_loaded(),
-            "whisper_model_loaded": SpeechRecognizer.is_whisper_model_loaded(),
-            "audio_logging_enabled": SpeechRecognizer.audio_log_config.enabled,
-            "audio_log_dir": SpeechRecognizer.audio_log_config.output_dir,
-            "vad_config": SpeechRecognizer.vad_config.to_dict(),
-            "continuous_recognition": cls.continuous_recognition
-        }
+        # 設定由来の項目はキャッシュし、セッション数のみ毎回取得する
+        if cls._health_cache_static is None:
+            cls._health_cache_static = {
+                "status": "healthy",
+                "vad_model_loaded": SpeechRecognizer.is_vad_model_loaded(),
+                "whisper_model_loaded": SpeechRecognizer.is_whisper_model_loaded(),
+                "audio_logging_enabled": SpeechRecognizer.audio_log_config.enabled,
+                "audio_log_dir": SpeechRecognizer.audio_log_config.output_dir,
+                "vad_config": SpeechRecognizer.vad_config.to_dict(),
+                "continuous_recognition": cls.continuous_recognition
+            }
+        return {**cls._health_cache_static, "active_sessions": len(cls.active_sessions)}
 
@@ -1,5 +1,5 @@
 import logging
-import json
+import orjson
 import os
 from datetime import datetime
 from pathlib import Path
@@ -8,11 +8,14 @@ logger = logging.getLogger(__name__)
 
 # 音声ログ設定
 class AudioLogConfig:
+    __slots__ = ('enabled', 'output_dir', 'max_files', 'config_file', '_saved_data')
+
     def __init__(self):
         self.enabled = True  # 音声ログ出力の有効/無効
         self.output_dir = "audio_logs"  # 出力ディレクトリ
         self.max_files = 1000  # 最大ファイル数（古いファイルを自動削除）
         self.config_file = "config/audio-log-config.json"
+        self._saved_data = None  # 最後に保存（読み込み）した設定内容
 
     def ensure_output_dir(self):
         """出力ディレクトリが存在することを確認"""
@@ -23,12 +26,14 @@ class AudioLogConfig:
         """設定ファイルから設定を読み込む"""
         try:
             if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config_data = json.load(f)
+                with open(self.config_file, 'rb') as f:
+                    config_data = orjson.loads(f.read())
 
                 self.enabled = config_data.get('enabled', self.enabled)
                 self.output_dir = config_data.get('output_dir', self.output_dir)
                 self.max_files = config_data.get('max_files', self.max_files)
+                config_data.pop('last_updated', None)
+                self._saved_data = config_data
                 
                 logger.info(f"Audio log configuration loaded from {self.config_file}")
                 return True
@@ -48,12 +53,16 @@ class AudioLogConfig:
             config_data = {
                 'enabled': self.enabled,
                 'output_dir': self.output_dir,
-                'max_files': self.max_files,
-                'last_updated': datetime.now().isoformat()
+                'max_files': self.max_files
             }
-            
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config_data, f, ensure_ascii=False, indent=2)
+
+            # 前回保存した内容から変更が無ければ書き込まない
+            if config_data == self._saved_data and os.path.exists(self.config_file):
+                return True
+
+            with open(self.config_file, 'wb') as f:
+                f.write(orjson.dumps({**config_data, 'last_updated': datetime.now().isoformat()}, option=orjson.OPT_INDENT_2))
+            self._saved_data = config_data
             
             logger.info(f"audio log configuration saved to {self.config_file}")
             return True
@@ -1,89 +1,185 @@
 from pathlib import Path
-import json
 import numpy as np
 import logging
-from datetime import datetime
+import os
+import queue
+import struct
+import time
+from collections import deque
+from threading import Thread
 
 logger = logging.getLogger(__name__)
 
+# 書き込みキューが満杯の場合に空きを待つ最大時間（秒）
+_QUEUE_PUT_TIMEOUT_SEC = 0.1
+
+# RAW ファイル先頭のヘッダー (64 bytes, little-endian)
+#   magic, sample_rate, channels, data_type, samples, session_id (UTF-8, 最大 32 bytes), 予約領域
+RAW_HEADER_MAGIC = b'SRAW'
+RAW_HEADER_STRUCT = struct.Struct('<4sIHHQ32s12x')
+RAW_DATA_TYPES = {1: "float32"}
+
+# 再生用に変換した WAV ファイルを置くディレクトリ（出力ディレクトリ内のサブディレクトリ）
+WAV_CACHE_DIR = "wav_cache"
+
 class AudioLogger:
     def __init__(self, config):
         self.config = config
         self.sample_rate = 16000
+        # 出力ディレクトリ内の RAW ファイル一覧 (作成日時, パス) を作成日時順に保持
+        self._files = deque()
+        self._files_dir = None  # _files を作成した出力ディレクトリ
+        # ファイル名のタイムスタンプのうち、秒までの部分を同じ秒の間は使い回す
+        self._timestamp_sec = None
+        self._timestamp_prefix = ""
+        # ファイル書き込みは専用のワーカースレッドで行う
+        self._write_queue = queue.Queue(maxsize=64)
+        self._worker_thread = Thread(target=self._worker, daemon=True)
+        self._worker_thread.start()
         
     def save_audio_raw(self, audio_data, session_id):
-        """音声データを RAW 形式で保存"""
+        """音声データを RAW 形式で保存（書き込みはワーカースレッドで非同期に実行）
+
+        Returns:
+            保存先のファイルパス。キューへの追加に失敗した場合は None
+        """
         if not self.config.enabled:
             return None
             
         try:
             # ファイル名生成（タイムスタンプ + セッション ID）
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]  # ミリ秒まで
-            filename = f"audio_{timestamp}_session_{session_id}.raw"
+            # 秒が変わった場合のみ日時を文字列に変換し、ミリ秒の部分だけを毎回付け加える
+            now_ns = time.time_ns()
+            sec, ns = divmod(now_ns, 1_000_000_000)
+            if sec != self._timestamp_sec:
+                self._timestamp_prefix = time.strftime("%Y%m%d_%H%M%S", time.localtime(sec))
+                self._timestamp_sec = sec
+            filename = f"audio_{self._timestamp_prefix}_{ns // 1_000_000:03d}_session_{session_id}.raw"  # ミリ秒まで
             filepath = Path(self.config.output_dir) / filename
             
             # 音声データを numpy 配列として準備
-            if isinstance(audio_data, list):
-                audio_array = np.array(audio_data, dtype=np.float32)
-            else:
-                audio_array = audio_data.astype(np.float32)
-                
-            # RAW 形式で保存（Float32 little-endian）
-            audio_array.tobytes('C')  # メモリレイアウトを確認
-            with open(filepath, 'wb') as f:
-                f.write(audio_array.tobytes())
-                
-            # メタデータファイルも保存（オプション）
-            meta_filepath = filepath.with_suffix('.meta')
-            metadata = {
-                "filename": filename,
-                "session_id": session_id,
-                "timestamp": timestamp,
-                "sample_rate": self.sample_rate,
-                "channels": 1,
-                "data_type": "float32",
-                "duration_seconds": len(audio_array) / self.sample_rate,
-                "samples": len(audio_array)
-            }
+            # (呼び出し側は保存後に配列を書き換えないため、Float32 であればコピーせずに渡す)
+            audio_array = np.asarray(audio_data, dtype=np.float32)
+
+            # キューが満杯の場合は少しだけ待ち、それでも空かなければ今回の保存は諦める
+            self._write_queue.put((audio_array, session_id, filepath), timeout=_QUEUE_PUT_TIMEOUT_SEC)
+            return str(filepath)
             
-            with open(meta_filepath, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
+        except queue.Full:
+            logger.warning(f"Audio log queue is full, dropped audio log for session {session_id}")
+            return None
+        except Exception as e:
+            logger.error(f"Failed to save audio log: {e}")
+            return None
+
+
+    def _worker(self):
+        """音声ログ書き込みのワーカースレッド"""
+        while True:
+            task = self._write_queue.get()
+            if task is None:  # 終了シグナル
+                break
+            self._write_audio_raw(*task)
+
+
+    def _write_audio_raw(self, audio_array, session_id, filepath):
+        """音声データをメタデータのヘッダー付きでファイルに書き込む"""
+        try:
+            # 出力ディレクトリが変わった場合（初回を含む）は、既存ファイルの一覧を作り直す
+            if self._files_dir != self.config.output_dir:
+                self._load_file_list()
+
+            # メタデータをヘッダーとして先頭に付け、RAW 形式で保存（Float32 little-endian）
+            header = RAW_HEADER_STRUCT.pack(
+                RAW_HEADER_MAGIC, self.sample_rate, 1, 1, len(audio_array), str(session_id).encode('utf-8')
+            )
+            # 一時ファイルに書き込んでから名前を変更し、書き込み途中の RAW ファイルが見えないようにする
+            tmp_path = f"{filepath}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(header)
+                    f.write(audio_array.tobytes())
+                os.replace(tmp_path, filepath)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
                 
             logger.info(f"Audio log saved: {filepath} ({len(audio_array)} samples, {len(audio_array)/self.sample_rate:.2f}s)")
             
-            # クリーンアップを定期的に実行
-            if np.random.random() < 0.1:  # 10% の確率で実行
-                self.cleanup_old_files()
+            # 最大ファイル数を超えた分の古いファイルを削除
+            self._files.append((time.time(), str(filepath)))
+            self._remove_excess_files()
                 
-            return str(filepath)
-            
         except Exception as e:
             logger.error(f"Failed to save audio log: {e}")
+
+
+    @staticmethod
+    def read_header(filepath):
+        """RAW ファイルのヘッダーからメタデータを読み込む
+
+        Returns:
+            メタデータの辞書。ヘッダーの無い旧形式のファイルの場合は None
+        """
+        with open(filepath, 'rb') as f:
+            data = f.read(RAW_HEADER_STRUCT.size)
+        if len(data) < RAW_HEADER_STRUCT.size or not data.startswith(RAW_HEADER_MAGIC):
             return None
 
+        _, sample_rate, channels, data_type, samples, session_id = RAW_HEADER_STRUCT.unpack(data)
+        return {
+            "session_id": session_id.rstrip(b'\0').decode('utf-8', errors='replace'),
+            "sample_rate": sample_rate,
+            "channels": channels,
+            "data_type": RAW_DATA_TYPES.get(data_type, "unknown"),
+            "duration_seconds": samples / sample_rate if sample_rate else 0,
+            "samples": samples,
+            "header_size": RAW_HEADER_STRUCT.size
+        }
+
 
     def cleanup_old_files(self):
-        """古いファイルをクリーンアップ"""
+        """古いファイルをクリーンアップ（出力ディレクトリを走査し直す）"""
         if not self.config.enabled:
             return
             
         try:
-            output_path = Path(self.config.output_dir)
-            if not output_path.exists():
-                return
-                
-            # ファイル一覧を取得（作成日時順）
-            files = sorted(output_path.glob("*.raw"), key=lambda x: x.stat().st_ctime)
-            
-            # 最大ファイル数を超えている場合、古いファイルを削除
-            if len(files) > self.config.max_files:
-                files_to_delete = files[:-self.config.max_files]
-                for file_path in files_to_delete:
-                    try:
-                        file_path.unlink()
-                        logger.info(f"Deleted old audio log file: {file_path}")
-                    except Exception as e:
-                        logger.error(f"Failed to delete file {file_path}: {e}")
-
+            self._load_file_list()
+            self._remove_excess_files()
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
+
+
+    def _load_file_list(self):
+        """出力ディレクトリを走査し、RAW ファイル一覧を作成日時順に作成"""
+        files = []
+        output_path = Path(self.config.output_dir)
+        if output_path.exists():
+            # DirEntry.stat() の結果はキャッシュされる
+            with os.scandir(output_path) as it:
+                files = [(entry.stat().st_ctime, entry.path) for entry in it if entry.name.endswith('.raw')]
+        self._files = deque(sorted(files))
+        self._files_dir = self.config.output_dir
+
+
+    def _remove_excess_files(self):
+        """最大ファイル数を超えている場合、古いファイルから削除"""
+        while len(self._files) > self.config.max_files:
+            _, path = self._files.popleft()
+            # 旧形式のメタデータファイルと再生用にキャッシュした WAV ファイルも削除
+            # (RAW ファイルのパスは必ず '.raw' で終わるため、拡張子は文字列操作で付け替える)
+            base = path[:-4]
+            dirname, stem = os.path.split(base)
+            wav_cache_path = os.path.join(dirname, WAV_CACHE_DIR, stem + '.wav')
+            try:
+                for file_path in (path, base + '.meta', wav_cache_path, base + '.wav'):
+                    try:
+                        os.unlink(file_path)
+                    except FileNotFoundError:
+                        pass
+                logger.info(f"Deleted old audio log file: {path}")
+            except Exception as e:
+                logger.error(f"Failed to delete file {path}: {e}")
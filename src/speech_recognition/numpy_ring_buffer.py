@@ -1,13 +1,17 @@
 import numpy as np
-import threading
-from typing import Union, Optional, List
+from typing import Union, List
 
 
 class NumPyRingBuffer:
     """
-    スレッドセーフな NumPy 配列ベースのリングバッファ
+    NumPy 配列ベースのリングバッファ
     数値データの高速な一括処理に最適化されています。
+    要素の追加・取得は put_bulk / get_bulk（get_bulk_into）で一括して行います。
+    排他制御は行わないため、スレッドセーフではありません（単一のスレッドから使用してください）。
+    データ数は count 属性で直接参照できます。
     """
+
+    __slots__ = ('maxsize', 'dtype', 'buffer', 'head', 'tail', 'count')
     
     def __init__(self, maxsize: int, dtype=np.float64):
         """
@@ -24,26 +28,8 @@ class NumPyRingBuffer:
         self.head = 0  # 次に書き込む位置
         self.tail = 0  # 次に読み込む位置
         self.count = 0  # 現在のデータ数
-        #self.lock = threading.Lock()
 
     
-    def put(self, item: Union[int, float]) -> None:
-        """
-        単一の要素をバッファに追加
-        
-        Args:
-            item: 追加する数値
-        """
-        #with self.lock:
-        self.buffer[self.head] = item
-        self.head = (self.head + 1) % self.maxsize
-        
-        if self.count < self.maxsize:
-            self.count += 1
-        else:
-            # バッファが満杯の場合、tail も進める（古いデータを上書き）
-            self.tail = (self.tail + 1) % self.maxsize
-    
     def put_bulk(self, data: Union[List, np.ndarray]) -> None:
         """
         複数の要素を一括でバッファに追加
@@ -51,7 +37,6 @@ class NumPyRingBuffer:
         Args:
             data: 追加するデータの配列
         """
-        #with self.lock:
         # 引数の data が dtype が一致する numpy 配列の場合、コピーは作られない
         data = np.asarray(data, dtype=self.dtype)
         n = len(data)
@@ -90,22 +75,6 @@ class NumPyRingBuffer:
                 self.count = self.maxsize
 
     
-    def get(self) -> Optional[Union[int, float]]:
-        """
-        単一の要素をバッファから取得
-        
-        Returns:
-            取得した数値。バッファが空の場合は None
-        """
-        #with self.lock:
-        if self.count == 0:
-            return None
-        
-        item = self.buffer[self.tail]
-        self.tail = (self.tail + 1) % self.maxsize
-        self.count -= 1
-        return item
-    
     def get_bulk(self, n: int) -> np.ndarray:
         """
         複数の要素を一括でバッファから取得
@@ -116,13 +85,12 @@ class NumPyRingBuffer:
         Returns:
             取得したデータの numpy 配列
         """
-        #with self.lock:
         if self.count == 0:
             return np.array([], dtype=self.dtype)
         
         # 実際に取得できる数は要求数と現在のデータ数の最小値
         actual_n = min(n, self.count)
-        result = np.zeros(actual_n, dtype=self.dtype)
+        result = np.empty(actual_n, dtype=self.dtype)
         
         if self.tail + actual_n <= self.maxsize:
             # 境界をまたがない場合
@@ -139,6 +107,51 @@ class NumPyRingBuffer:
         
         return result
     
+    def get_bulk_into(self, out: np.ndarray) -> int:
+        """
+        複数の要素を一括でバッファから取得し、呼び出し側が用意した配列に書き込む
+        (結果用の配列を確保しない get_bulk)
+        
+        Args:
+            out: 書き込み先の numpy 配列（最大 len(out) 個の要素を取得）
+            
+        Returns:
+            実際に取得した要素数
+        """
+        actual_n = min(len(out), self.count)
+        if actual_n == 0:
+            return 0
+        
+        if self.tail + actual_n <= self.maxsize:
+            # 境界をまたがない場合
+            out[:actual_n] = self.buffer[self.tail:self.tail + actual_n]
+        else:
+            # 境界をまたぐ場合
+            split = self.maxsize - self.tail
+            out[:split] = self.buffer[self.tail:]
+            out[split:actual_n] = self.buffer[:actual_n - split]
+        
+        # tail と count の更新
+        self.tail = (self.tail + actual_n) % self.maxsize
+        self.count -= actual_n
+        
+        return actual_n
+    
+    def skip(self, n: int) -> int:
+        """
+        先頭から n 個の要素を読み飛ばす（取得せずに削除する get_bulk）
+        
+        Args:
+            n: 読み飛ばす要素数
+            
+        Returns:
+            実際に読み飛ばした要素数
+        """
+        actual_n = min(max(n, 0), self.count)
+        self.tail = (self.tail + actual_n) % self.maxsize
+        self.count -= actual_n
+        return actual_n
+    
     def peek(self, n: int = 1) -> np.ndarray:
         """
         データを削除せずに先頭から n 個の要素を取得
@@ -149,12 +162,11 @@ class NumPyRingBuffer:
         Returns:
             先頭から n 個の要素の numpy 配列
         """
-        #with self.lock:
         if self.count == 0:
             return np.array([], dtype=self.dtype)
         
         actual_n = min(n, self.count)
-        result = np.zeros(actual_n, dtype=self.dtype)
+        result = np.empty(actual_n, dtype=self.dtype)
         
         if self.tail + actual_n <= self.maxsize:
             result[:] = self.buffer[self.tail:self.tail + actual_n]
@@ -172,11 +184,10 @@ class NumPyRingBuffer:
         Returns:
             バッファ内の全データの numpy 配列
         """
-        #with self.lock:
         if self.count == 0:
             return np.array([], dtype=self.dtype)
         
-        result = np.zeros(self.count, dtype=self.dtype)
+        result = np.empty(self.count, dtype=self.dtype)
         
         if self.tail + self.count <= self.maxsize:
             result[:] = self.buffer[self.tail:self.tail + self.count]
@@ -186,27 +197,42 @@ class NumPyRingBuffer:
             result[split:] = self.buffer[:self.count - split]
         
         return result
-    
+
+    def get_all_view(self) -> np.ndarray:
+        """
+        バッファ内の全データを取得（削除せず）
+        データがバッファの境界をまたがない場合は、コピーせずに内部バッファの読み取り専用ビューを返す
+
+        返されたビューは、次に put_bulk / clear などでバッファを変更するまでの間だけ有効です。
+        それ以降も使用する場合や、非同期処理に渡す場合は get_all を使用してください。
+
+        Returns:
+            バッファ内の全データの numpy 配列（ビュー、または、境界をまたぐ場合はコピー）
+        """
+        if self.tail + self.count > self.maxsize:
+            # 境界をまたぐ場合はコピーする
+            return self.get_all()
+
+        view = self.buffer[self.tail:self.tail + self.count]
+        view.flags.writeable = False
+        return view
+
     def clear(self) -> None:
         """バッファをクリア"""
-        #with self.lock:
         self.head = 0
         self.tail = 0
         self.count = 0
     
     def size(self) -> int:
         """現在のデータ数を取得"""
-        #with self.lock:
         return self.count
     
     def is_empty(self) -> bool:
         """バッファが空かどうかを判定"""
-        #with self.lock:
         return self.count == 0
     
     def is_full(self) -> bool:
         """バッファが満杯かどうかを判定"""
-        #with self.lock:
         return self.count == self.maxsize
     
     def capacity(self) -> int:
@@ -220,20 +246,17 @@ if __name__ == "__main__":
     # Basic usage example
     buffer = NumPyRingBuffer(maxsize=10, dtype=np.float64)
     
-    # 単一要素の追加・取得
-    # Adding and retrieving single elements
-    buffer.put(1.0)
-    buffer.put(2.0)
-    print(f"Single retrieve: {buffer.get()}")  # 1.0
-    
     # 一括追加・取得
     # Bulk adding and retrieving
+    buffer.put_bulk([1, 2])
+    print(f"Bulk retrieve: {buffer.get_bulk(1)}")  # [1.]
     buffer.put_bulk([3, 4, 5, 6, 7])
     print(f"Bulk retrieve: {buffer.get_bulk(3)}")  # [2. 3. 4.]
     
     # 全データの確認
     # Viewing all data in the buffer
     print(f"All data: {buffer.get_all()}")  # [5. 6. 7.]
+    print(f"All data (view): {buffer.get_all_view()}")  # [5. 6. 7.]
     
     # バッファ状態の確認
     # Checking buffer status
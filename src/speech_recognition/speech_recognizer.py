@@ -2,6 +2,7 @@ import torch
 import numpy as np
 import whisper
 import inspect, asyncio
+import math
 import uuid
 from enum import Enum
 from itertools import islice
@@ -58,6 +59,16 @@ class Meta(type):
 ##########################################
 class SpeechRecognizer(metaclass=Meta):
 
+    # インスタンスはセッションごとに作成され、属性は VAD のチャンクごとに参照されるため、
+    # __dict__ を持たせずに固定のスロットに格納する
+    __slots__ = (
+        '_session_id', '_speech_id', '_sample_rate', '_whisper_processor', '_prompt',
+        '_chunk_size', '_threshold', '_min_speech_samples', '_max_speech_samples', '_prefix_pad_samples',
+        '_silence_duration_frames', '_audio_buffer', '_chunk_buffer', '_stitch_chunk',
+        '_silence_counter', '_speech_start_index', '_energy_gate_ratio', '_noise_floor',
+        '_vad_input', '_vad_input_np', '_pcm_scratch', '_decode', '_callback', '_running_loop'
+    )
+
     class State(Enum):
         SPEECH_START = 1
         SPEECH_END = 2
@@ -73,6 +84,41 @@ class SpeechRecognizer(metaclass=Meta):
     def is_whisper_model_loaded():
         return WhisperProcessor.is_model_loaded()
 
+    @classmethod
+    def preload_vad(cls):
+        """silero VAD モデルをロードし、ダミー推論でウォームアップする"""
+        if cls._vad_model is None:
+            ## キャッシュが存在しない場合、GitHub から最新バージョンをダウンロード（source='github'）
+            ## ダウンロードした内容は ~/.cache/torch/hub/... にキャッシュされる
+            try:
+                cls._vad_model, _ = torch.hub.load(
+                    repo_or_dir='snakers4/silero-vad',
+                    model='silero_vad',
+                    force_reload=False, # キャッシュしたモデルが存在すれば、それを使用する
+                    onnx=False
+                )
+                logger.info("Silero VAD model loaded successfully")
+            except Exception as e:
+                logger.error(f"Failed to load Silero VAD model: {e}")
+                cls._vad_model = None
+                return False
+
+        try:
+            # 無音データで一度推論し、初回リクエスト時の初期化コストを事前に支払う
+            with torch.inference_mode():
+                cls._vad_model(torch.zeros(cls.vad_config.chunk_size), 16000)
+            cls._vad_model.reset_states()
+            logger.info("Silero VAD model warmed up")
+        except Exception as e:
+            logger.warning(f"Silero VAD model warm-up failed: {e}")
+
+        return True
+
+    @staticmethod
+    def preload_whisper(model_name):
+        """Whisper モデルをロードし、ダミー推論でウォームアップする"""
+        return WhisperProcessor.load_model(model_name)
+
     def __init__(self, session_id, callback, running_loop):
         self._session_id = session_id
         self._speech_id = None
@@ -83,16 +129,29 @@ class SpeechRecognizer(metaclass=Meta):
         
         vad_config = SpeechRecognizer.vad_config;
         self._chunk_size = vad_config.chunk_size
-        self._min_speech_duration_s = vad_config.min_speech_duration_s
-        self._max_speech_duration_s = vad_config.max_speech_duration_s
-        self._prefix_speech_pad_s = vad_config.prefix_speech_pad_s
+        # 設定値から求める値はセッション開始時に一度だけ計算する
+        self._threshold = float(vad_config.threshold)
+        self._min_speech_samples = int(self._sample_rate * vad_config.min_speech_duration_s)
+        self._max_speech_samples = int(self._sample_rate * vad_config.max_speech_duration_s)
+        self._prefix_pad_samples = int(self._sample_rate * vad_config.prefix_speech_pad_s)
         self._silence_duration_frames = int((self._sample_rate * vad_config.silence_duration_ms) / (self._chunk_size * 1000))
 
         audio_buffer_sec = vad_config.max_speech_duration_s + vad_config.prefix_speech_pad_s + vad_config.silence_duration_s
         self._audio_buffer = NumPyRingBuffer(maxsize=int(self._sample_rate*audio_buffer_sec), dtype=np.float32)
         self._chunk_buffer = NumPyRingBuffer(self._chunk_size, dtype=np.float32)
+        self._stitch_chunk = np.empty(self._chunk_size, dtype=np.float32)
         self._silence_counter = 0
         self._speech_start_index = -1
+        self._energy_gate_ratio = vad_config.energy_gate_ratio
+        self._noise_floor = 0.0
+
+        # VAD 入力用のテンソルを使い回す（NumPy 配列とメモリを共有）
+        self._vad_input = torch.empty(self._chunk_size, dtype=torch.float32)
+        self._vad_input_np = self._vad_input.numpy()
+
+        # 16bit PCM から Float32 への変換用バッファ
+        self._pcm_scratch = np.empty(0, dtype=np.float32)
+        self._decode = self._decode_auto  # サンプル形式が指定されるまではデータから判定する
 
         self._callback = callback
         self._running_loop = running_loop
@@ -127,42 +186,67 @@ class SpeechRecognizer(metaclass=Meta):
             logger.warn(f"Invalid prompt value: {value}")
             self._prompt = value
 
-    def add_audio_chunk(self, audio_data):
-        # データ形式を判定して処理
+    def set_sample_format(self, sample_format):
+        """受信する音声データのサンプル形式を設定する（セッション開始時に一度だけ呼び出す）
+
+        Args:
+            sample_format: "i16"（16bit PCM）、"f32"（Float32）、
+                           または None（チャンクごとにデータから判定する。従来の動作）
+        """
+        if sample_format is None:
+            self._decode = self._decode_auto
+        elif sample_format == "i16":
+            self._decode = self._decode_i16
+        elif sample_format == "f32":
+            self._decode = self._decode_f32
+        else:
+            raise ValueError(f"Unsupported sample format: {sample_format}")
+
+    def _decode_auto(self, audio_data):
+        """サンプル形式をデータから判定して Float32 に変換する（サンプル形式が指定されない場合）"""
         if len(audio_data) % 4 == 0:
             # Float32 配列として解釈を試行
-            try:
-                float32_array = np.frombuffer(audio_data, dtype=np.float32)
-                # 妥当な範囲チェック（Float32 は通常 -1.0〜1.0）
-                if np.all(np.abs(float32_array) <= 1.5):  # 少し余裕を持たせる
-                    # Float32 として処理
-                    logger.debug(f"Received Float32 data: {len(float32_array)} samples")
-                    self._audio_buffer.put_bulk(float32_array)
-                    # VAD、および、音声認識を実行
-                    self._process_audio(float32_array)
-                    return
-
-            except (ValueError, OverflowError):
-                # Float32 では無かった
-                pass
+            float32_array = np.frombuffer(audio_data, dtype=np.float32)
+            # 妥当な範囲チェック（Float32 は通常 -1.0〜1.0）
+            # 一時配列を作らないよう、最大値・最小値の比較で判定する（NaN を含む場合は False）
+            if len(float32_array) > 0 and float32_array.max() <= 1.5 and float32_array.min() >= -1.5:  # 少し余裕を持たせる
+                return float32_array
 
         # 16bit PCM として処理
+        return self._decode_i16(audio_data)
+
+    def _decode_f32(self, audio_data):
+        """Float32 の音声データをそのまま配列として解釈する（コピーなし）"""
+        return np.frombuffer(audio_data, dtype=np.float32)
+
+    def _decode_i16(self, audio_data):
+        """16bit PCM の音声データを Float32 (-1.0 to 1.0) に変換する"""
         int16_array = np.frombuffer(audio_data, dtype=np.int16)
-        logger.debug(f"Received 16bit PCM data: {len(int16_array)} samples")
-        # Float32 に変換 (-1.0 to 1.0)
-        float32_array = int16_array.astype(np.float32) / 32768.0
+        # 変換先のバッファはセッション内で使い回す（不足する場合のみ拡張）
+        n = len(int16_array)
+        if len(self._pcm_scratch) < n:
+            self._pcm_scratch = np.empty(n, dtype=np.float32)
+        float32_array = self._pcm_scratch[:n]
+        np.multiply(int16_array, np.float32(1.0 / 32768.0), out=float32_array)
+        return float32_array
+
+    def add_audio_chunk(self, audio_data):
+        # セッション開始時に指定されたサンプル形式（指定が無ければデータから判定）で Float32 に変換
+        float32_array = self._decode(audio_data)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Received audio data: {len(float32_array)} samples")
         self._audio_buffer.put_bulk(float32_array)
-            
+
         # VAD、および、音声認識を実行
         self._process_audio(float32_array)
 
 
     def _notify(self, state):
         if inspect.iscoroutinefunction(self._callback):
-            coroutine = self._callback(state, self._session_id, self._speech_id, self._audio_buffer.size())
+            coroutine = self._callback(state, self._session_id, self._speech_id, self._audio_buffer.count)
             asyncio.create_task(coroutine)  # あるいは asyncio.run(coroutine)
         else:
-            self._callback(state, self._session_id, self._speech_id, self._audio_buffe.size())
+            self._callback(state, self._session_id, self._speech_id, self._audio_buffer.count)
 
 
     def _process_audio(self, audio_array):
@@ -170,74 +254,177 @@ class SpeechRecognizer(metaclass=Meta):
             return
 
         # バッファ内に未処理の音声データが存在する場合、
-        # 未処理の音声データと要求された音声データとを結合する
-        count = self._chunk_buffer.size()
+        # 未処理の音声データと要求された音声データの先頭とをつなげて最初のチャンクを処理する
+        # (音声データ全体は結合せず、コピーはチャンク 1 個分のみ)
+        start = 0
+        count = self._chunk_buffer.count
         if count > 0:
-            audio_array = np.concatenate((self._chunk_buffer.get_bulk(count), audio_array))
+            start = self._chunk_size - count
+            if len(audio_array) < start:
+                self._chunk_buffer.put_bulk(audio_array)
+                return
+            self._chunk_buffer.get_bulk_into(self._stitch_chunk[:count])
+            self._stitch_chunk[count:] = audio_array[:start]
             self._chunk_buffer.clear()
+            self._process_audio_frames(self._stitch_chunk.reshape(1, self._chunk_size))
 
-        # 音声データをチャンクサイズごとに切り出して処理する
-        start = 0
-        remain = len(audio_array)
-        while remain >= self._chunk_size:
-            self._process_audio_chunk(audio_array[start:start+self._chunk_size])
-            start += self._chunk_size
-            remain -= self._chunk_size
+        # 残りの音声データはコピーせず、(チャンク数, チャンクサイズ) のビューとしてまとめて処理する
+        remain = len(audio_array) - start
+        nchunks = remain // self._chunk_size
+        if nchunks > 0:
+            end = start + nchunks * self._chunk_size
+            self._process_audio_frames(audio_array[start:end].reshape(nchunks, self._chunk_size))
+            start = end
+            remain -= nchunks * self._chunk_size
 
         # 未処理の音声データが存在する場合、バッファに入れる
         if remain > 0:
             self._chunk_buffer.put_bulk(audio_array[start:])
 
 
-    def _process_audio_chunk(self, audio_chunk):
-        """音声を処理して VAD 判定を行う"""
+    def _process_audio_frames(self, frames):
+        """(チャンク数, チャンクサイズ) に並べた音声データに対して VAD 判定を行う
+
+        silero VAD は直前のチャンクまでの内部状態を使って推論するため、
+        同一ストリームの連続するチャンクをバッチ次元に並べて一度に推論することはできない。
+        そのため、エネルギー計算のみをまとめて行い、推論は inference_mode の中で順に実行する。
+        発話の開始・終了の判定とノイズフロアの更新は、全チャンクの判定結果に対してまとめて行う。
+        """
+        # 各チャンクの平均エネルギーを一度に計算
+        energies = np.einsum('ij,ij->i', frames, frames) / self._chunk_size
+
+        speech_probs = np.empty(len(frames), dtype=np.float32)
+        with torch.inference_mode():
+            for i, (audio_chunk, energy) in enumerate(zip(frames, energies.tolist())):
+                speech_probs[i] = self._process_audio_chunk(audio_chunk, energy)
+
+        try:
+            self._update_speech_state(speech_probs, energies)
+        except Exception as e:
+            logger.error(f"VAD processing error: {e}")
+
+
+    def _process_audio_chunk(self, audio_chunk, energy):
+        """音声を処理して VAD の音声確率を求める
+
+        Args:
+            audio_chunk: チャンクサイズ分の音声データ
+            energy: audio_chunk の平均エネルギー
+
+        Returns:
+            音声確率 (VAD の実行に失敗した場合は 0.0)
+        """
 
         # 音声データの統計をログ記録
         if logger.isEnabledFor(logging.DEBUG):
-            rms = np.sqrt(np.mean(audio_chunk**2))
+            # 平均エネルギー（二乗平均）は計算済みなので、その平方根を RMS とする
+            rms = math.sqrt(energy)
             logger.debug(f"Audio RMS: {rms:.4f}, Buffer size: {len(audio_chunk)}")
 
         # VAD 実行
         try:
-            speech_prob = SpeechRecognizer._vad_model(torch.from_numpy(audio_chunk), self._sample_rate).item()
+            # 平均エネルギーがノイズフロアに対して十分小さいチャンクは、VAD モデルを実行せずに無音とみなす
+            # (energy_gate_ratio が 0 の場合は常に VAD モデルを実行する)
+            if energy < self._energy_gate_ratio * self._noise_floor:
+                speech_prob = 0.0
+            else:
+                np.copyto(self._vad_input_np, audio_chunk)
+                speech_prob = SpeechRecognizer._vad_model(self._vad_input, self._sample_rate).item()
             # 設定可能な閾値を使用
-            is_speech = speech_prob > SpeechRecognizer.vad_config.threshold
+            is_speech = speech_prob > self._threshold
             
             if logger.isEnabledFor(logging.DEBUG):
-                logger.debug(f"Speech probability: {speech_prob:.3f}, Is speech: {is_speech}, Threshold: {SpeechRecognizer.vad_config.threshold}")
+                logger.debug(f"Speech probability: {speech_prob:.3f}, Is speech: {is_speech}, Threshold: {self._threshold}")
 
-            if is_speech:
-                if self._speech_start_index < 0:
-                    self._speech_id = str(uuid.uuid4())
-                    self._speech_start_index = max(0, self._audio_buffer.size() - int(self._sample_rate * self._prefix_speech_pad_s))
+            return speech_prob
 
-                    logger.info(f"Speech started for session {self._session_id} (prob: {speech_prob:.3f})")
-                    self._notify(SpeechRecognizer.State.SPEECH_START)
+        except Exception as e:
+            logger.error(f"VAD processing error: {e}")
+            return 0.0
+
+
+    def _update_speech_state(self, speech_probs, energies):
+        """チャンクごとの音声確率から発話の開始・終了を判定する
+
+        状態が変わらないチャンクの並びは無音チャンクの数だけをまとめて数え、
+        発話の開始・終了が起きるチャンクのみ個別に処理する。
+        ノイズフロアは発話区間外の無音チャンクのエネルギーのみで更新する。
+        """
+        is_speech = speech_probs > self._threshold
+        speech_indices = np.flatnonzero(is_speech)
+        n = len(is_speech)
+        i = 0
+        while i < n:
+            # i 以降で最初に音声と判定されたチャンクの位置（無ければ n）
+            k = np.searchsorted(speech_indices, i)
+            next_speech = int(speech_indices[k]) if k < len(speech_indices) else n
+
+            if self._speech_start_index < 0:
+                # 発話待ち: 次の音声チャンクまでの無音チャンクでノイズフロアを更新し、音声チャンクで発話開始
+                if next_speech > i:
+                    self._update_noise_floor(energies[i:next_speech])
+                if next_speech == n:
+                    return
+                i = next_speech
+                self._speech_id = str(uuid.uuid4())
+                self._speech_start_index = max(0, self._audio_buffer.count - self._prefix_pad_samples)
+
+                logger.info(f"Speech started for session {self._session_id} (prob: {speech_probs[i]:.3f})")
+                self._notify(SpeechRecognizer.State.SPEECH_START)
 
                 self._silence_counter = 0
+                i += 1
 
             else:
-                if self._speech_start_index >= 0:
-                    self._silence_counter += 1
-                    if self._silence_counter >= self._silence_duration_frames:
-                        logger.info(f"Speech ended for session {self._session_id} (silence frames: {self._silence_counter})")
-
-                        self._audio_buffer.get_bulk(self._speech_start_index) # 読み飛ばす
-                        speech_array = self._audio_buffer.get_bulk(self._audio_buffer.size())
-                        
-                        # 音声認識を実行
-                        self._trigger_recognition(speech_array)
-
-                        self._silence_counter = 0
-                        self._audio_buffer.clear()
-                        self._speech_start_index = -1
-                        self._chunk_buffer.clear()
-                        self._notify(SpeechRecognizer.State.SPEECH_END)
-
-                        self._speech_id = None # Must be after _notify() has been called
-                    
-        except Exception as e:
-            logger.error(f"VAD processing error: {e}")
+                # 発話中: 次の音声チャンクまでの無音チャンクを数える
+                silent = next_speech - i
+                # 発話終了までに必要な無音チャンク数（無音チャンクが 1 つ以上あれば判定する）
+                remaining = max(1, self._silence_duration_frames - self._silence_counter)
+                if silent >= remaining:
+                    self._silence_counter += remaining
+                    i += remaining
+                    self._end_speech()
+                elif next_speech < n:
+                    self._silence_counter = 0
+                    i = next_speech + 1
+                else:
+                    self._silence_counter += silent
+                    return
+
+
+    def _update_noise_floor(self, energies):
+        """発話区間外の連続する無音チャンクのエネルギーでノイズフロアを更新する（指数移動平均）"""
+        if self._noise_floor <= 0:
+            # 初回は最初のチャンクのエネルギーで初期化
+            self._noise_floor = float(energies[0])
+            energies = energies[1:]
+        k = len(energies)
+        if k == 0:
+            return
+        # floor_k = 0.99^k * floor_0 + Σ 0.01 * 0.99^(k-1-j) * energy_j をまとめて計算
+        weights = 0.01 * np.power(0.99, np.arange(k - 1, -1, -1))
+        self._noise_floor = 0.99 ** k * self._noise_floor + float(np.dot(weights, energies))
+
+
+    def _end_speech(self):
+        """発話を終了し、発話区間の音声データで音声認識を実行する"""
+        logger.info(f"Speech ended for session {self._session_id} (silence frames: {self._silence_counter})")
+
+        # 発話開始位置までは配列を確保せずに読み飛ばす
+        # (発話の配列は音声認識・音声ログのキューでそのまま保持されるため、使い回さずに毎回確保する)
+        self._audio_buffer.skip(self._speech_start_index)
+        speech_array = self._audio_buffer.get_bulk(self._audio_buffer.count)
+        
+        # 音声認識を実行
+        self._trigger_recognition(speech_array)
+
+        self._silence_counter = 0
+        self._audio_buffer.clear()
+        self._speech_start_index = -1
+        self._chunk_buffer.clear()
+        self._notify(SpeechRecognizer.State.SPEECH_END)
+
+        self._speech_id = None # Must be after _notify() has been called
 
 
     def _trigger_recognition(self, speech_array):
@@ -248,16 +435,14 @@ class SpeechRecognizer(metaclass=Meta):
         
         try:
             # 設定可能な最小長チェック
-            min_length = self._sample_rate * self._min_speech_duration_s
-            if len(speech_array) < min_length:
-                logger.info(f"Speech too short ({len(speech_array)} samples < {min_length:.0f}), skipping recognition")
+            if len(speech_array) < self._min_speech_samples:
+                logger.info(f"Speech too short ({len(speech_array)} samples < {self._min_speech_samples}), skipping recognition")
                 return
 
             # 最大長チェック
-            max_length = self._sample_rate * self._max_speech_duration_s
-            if len(speech_array) > max_length:
-                logger.info(f"Speech too long ({len(speech_array)} samples > {max_length:.0f}), truncating")
-                speech_array = speech_array[:int(max_length)]
+            if len(speech_array) > self._max_speech_samples:
+                logger.info(f"Speech too long ({len(speech_array)} samples > {self._max_speech_samples}), truncating")
+                speech_array = speech_array[:self._max_speech_samples]
                 
             logger.info(f"Triggering recognition for {len(speech_array)} samples ({len(speech_array)/self._sample_rate:.2f}s)")
             
@@ -265,7 +450,7 @@ class SpeechRecognizer(metaclass=Meta):
             if SpeechRecognizer.audio_log_config.enabled:
                 log_file = SpeechRecognizer._audio_logger.save_audio_raw(speech_array, self._session_id)
                 if log_file:
-                    logger.info(f"Audio log saved for session {self._session_id}: {log_file}")
+                    logger.info(f"Audio log queued for session {self._session_id}: {log_file}")
                     
             # 非同期で音声認識を実行
             self._whisper_processor.recognize_async(
@@ -283,23 +468,4 @@ class SpeechRecognizer(metaclass=Meta):
             logger.error(f"Failed to trigger recognition: {e}")
 
 
-##########################################
-# silero VAD モデルをロード
-##########################################
-## キャッシュが存在しない場合、GitHub から最新バージョンをダウンロード（source='github'）
-## ダウンロードした内容は ~/.cache/torch/hub/... にキャッシュされる
-try:
-    SpeechRecognizer._vad_model, utils = torch.hub.load(
-        repo_or_dir='snakers4/silero-vad',
-        model='silero_vad',
-        force_reload=False, # キャッシュしたモデルが存在すれば、それを使用する
-        onnx=False
-    )
-    (get_speech_timestamps, save_audio, read_audio, VADIterator, collect_chunks) = utils
-    logger.info("Silero VAD model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load Silero VAD model: {e}")
-    SpeechRecognizer._vad_model = None
-
-
 SpeechRecognizer.load_config()
@@ -1,5 +1,6 @@
 import logging
-import json
+import orjson
+import math
 import os
 from datetime import datetime
 
@@ -7,6 +8,11 @@ logger = logging.getLogger(__name__)
 
 # Silero VAD 設定
 class VADConfig:
+    __slots__ = (
+        'threshold', 'min_speech_duration_ms', 'max_speech_duration_s', 'prefix_speech_pad_ms',
+        'silence_duration_ms', 'chunk_size', 'energy_gate_ratio', 'config_file', '_saved_data'
+    )
+
     def __init__(self):
         self.threshold = 0.5        # 音声判定閾値 (0.0-1.0)
         self.min_speech_duration_ms = 250    # 最小音声持続時間 (ms)
@@ -14,7 +20,9 @@ class VADConfig:
         self.prefix_speech_pad_ms = 300  # 音声前のパディング (ms)
         self.silence_duration_ms = 500   # 無音の最大継続時間（ms）
         self.chunk_size = 512       # 処理チャンクサイズ（サンプル数）
+        self.energy_gate_ratio = 0.0    # ノイズフロアに対するエネルギー比がこの値未満のチャンクは VAD を省略 (0 で無効)
         self.config_file = "config/vad-config.json"
+        self._saved_data = None  # 最後に保存（読み込み）した設定内容
 
     @property
     def min_speech_duration_s(self):
@@ -28,6 +36,13 @@ class VADConfig:
     def silence_duration_s(self):
         return self.silence_duration_ms / 1000
 
+    @property
+    def threshold_logit(self):
+        """音声判定閾値をロジットに変換した値 (閾値が 0.0 または 1.0 の場合は None)"""
+        if 0.0 < self.threshold < 1.0:
+            return math.log(self.threshold / (1.0 - self.threshold))
+        return None
+
     def reset(self):
         self.__init__()
         
@@ -35,19 +50,21 @@ class VADConfig:
         """設定を辞書形式で返す"""
         return {
             "threshold": self.threshold,
+            "threshold_logit": self.threshold_logit,
             "min_speech_duration_ms": self.min_speech_duration_ms,
             "max_speech_duration_s": self.max_speech_duration_s,
             "prefix_speech_pad_ms": self.prefix_speech_pad_ms,
             "silence_duration_ms": self.silence_duration_ms,
-            "chunk_size": self.chunk_size
+            "chunk_size": self.chunk_size,
+            "energy_gate_ratio": self.energy_gate_ratio
         }
 
     def load_config(self):
         """設定ファイルから設定を読み込む"""
         try:
             if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config_data = json.load(f)
+                with open(self.config_file, 'rb') as f:
+                    config_data = orjson.loads(f.read())
                     
                 self.threshold = config_data.get('threshold', self.threshold)
                 self.min_speech_duration_ms = config_data.get('min_speech_duration_ms', self.min_speech_duration_ms)
@@ -55,6 +72,9 @@ class VADConfig:
                 self.prefix_speech_pad_ms = config_data.get('prefix_speech_pad_ms', self.prefix_speech_pad_ms)
                 self.silence_duration_ms = config_data.get('silence_duration_ms', self.silence_duration_ms)
                 self.chunk_size = config_data.get('chunk_size', self.chunk_size)
+                self.energy_gate_ratio = config_data.get('energy_gate_ratio', self.energy_gate_ratio)
+                config_data.pop('last_updated', None)
+                self._saved_data = config_data
 
                 logger.info(f"VAD configuration loaded from {self.config_file}")
                 return True
@@ -81,6 +101,8 @@ class VADConfig:
                     self.max_speech_duration_s = max(0.1, float(value))
                 elif key in ["chunk_size"]:
                     setattr(self, key, max(1, int(value)))
+                elif key == "energy_gate_ratio":
+                    self.energy_gate_ratio = max(0.0, float(value))
                 elif key in ["activation_threshold"]:
                     setattr(self, key, max(0.0, float(1.0)))
 
@@ -91,14 +113,19 @@ class VADConfig:
                 'threshold': self.threshold,
                 'min_speech_duration_ms': self.min_speech_duration_ms,
                 'max_speech_duration_s': self.max_speech_duration_s,
-                'speech_pad_ms': self.speech_pad_ms,
+                'prefix_speech_pad_ms': self.prefix_speech_pad_ms,
                 'silence_duration_ms': self.silence_duration_ms,
                 'chunk_size': self.chunk_size,
-                'last_updated': datetime.now().isoformat()
+                'energy_gate_ratio': self.energy_gate_ratio
             }
 
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config_data, f, ensure_ascii=False, indent=2)
+            # 前回保存した内容から変更が無ければ書き込まない
+            if config_data == self._saved_data and os.path.exists(self.config_file):
+                return True
+
+            with open(self.config_file, 'wb') as f:
+                f.write(orjson.dumps({**config_data, 'last_updated': datetime.now().isoformat()}, option=orjson.OPT_INDENT_2))
+            self._saved_data = config_data
 
             logger.info(f"VAD configuration saved to {self.config_file}")
             return True
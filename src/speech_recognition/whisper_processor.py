@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import numpy as np
 import whisper
 from threading import Thread
 import queue
@@ -18,6 +19,53 @@ class WhisperProcessor:
     def is_model_loaded(cls):
         return cls._whisper_model is not None
 
+    @classmethod
+    def load_model(cls, model_name="base"):
+        """Whisper モデルをロードし、ダミー推論でウォームアップする
+
+        Model list:
+            tiny（多言語）, tiny.en（英語専用）
+            base（多言語）, base.en（英語専用）
+            small（多言語）, small.en（英語専用）
+            medium（多言語）, medium.en（英語専用）
+            large（多言語）
+            large-v2（多言語、性能強化版）
+            large-v3（多言語、最新強化版：Mel128 & Cantonese トークン対応）
+        """
+        if cls._whisper_model is not None:
+            return True
+
+        # モデル名が指定されていない場合（環境変数 WHISPER_MODEL が未設定など）は base を使用
+        if not model_name:
+            model_name = "base"
+
+        try:
+            # ~/.cache/whisper
+            # import torch
+            # device = "cpu"
+            # if torch.cuda.is_available():
+            #     device = "cuda"
+            # elif torch.backends.mps.is_available():
+            #     device = "mps" # 2025/7/7 現在、M1/M2/M3 Mac には未対応
+            # cls._whisper_model = whisper.load_model(model_name, device=device)
+
+            cls._whisper_model = whisper.load_model(model_name)
+            logger.info(f"Whisper model '{model_name}' loaded successfully (model info:{cls._whisper_model.dims})")
+
+        except Exception as e:
+            logger.error(f"Failed to load Whisper model: {e}")
+            cls._whisper_model = None
+            return False
+
+        try:
+            # 無音データで一度推論し、初回リクエスト時の初期化コストを事前に支払う
+            cls._whisper_model.transcribe(np.zeros(16000, dtype=np.float32), language="en", fp16=False, verbose=None)
+            logger.info(f"Whisper model '{model_name}' warmed up")
+        except Exception as e:
+            logger.warning(f"Whisper model warm-up failed: {e}")
+
+        return True
+
     def __init__(self):
         self._recognition_queue = queue.Queue()
         self._worker_thread = Thread(target=self._worker, daemon=True)
@@ -130,44 +178,3 @@ class WhisperProcessor:
         except Exception as e:
             logger.error(f"Failed to queue recognition: {e}")
 
-
-
-############################################################
-# Whisper モデルをロード
-############################################################
-try:
-    # 軽量なbaseモデルを使用（必要に応じてlarge-v3などに変更可能）
-    ############################################################3
-    # Model list
-    ############################################################3
-    # tiny（多言語）
-    # tiny.en（英語専用）
-    # base（多言語）
-    # base.en（英語専用）
-    # small（多言語）
-    # small.en（英語専用）
-    # medium（多言語）
-    # medium.en（英語専用）
-    # large（多言語）
-    # large-v2（多言語、性能強化版）
-    # large-v3（多言語、最新強化版：Mel128 & Cantonese トークン対応）
-    ############################################################3
-
-    if 'WHISPER_MODEL' not in globals():
-        WHISPER_MODEL = "base"
-
-    # ~/.cache/whisper
-    # import torch
-    # device = "cpu"
-    # if torch.cuda.is_available():
-    #     device = "cuda"
-    # elif torch.backends.mps.is_available():
-    #     device = "mps" # 2025/7/7 現在、M1/M2/M3 Mac には未対応
-    # WhisperProcessor._whisper_model = whisper.load_model(WHISPER_MODEL, device=device)
-
-    WhisperProcessor._whisper_model = whisper.load_model(WHISPER_MODEL)
-    logger.info(f"Whisper model '{WHISPER_MODEL}' loaded successfully (model info:{WhisperProcessor._whisper_model.dims})")
-
-except Exception as e:
-    logger.error(f"Failed to load Whisper model: {e}")
-    WhisperProcessor._whisper_model = None